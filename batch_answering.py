@@ -0,0 +1,166 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from functools import partial
+
+from chatbot.chatbot import ChatBot
+from data.crowd_data import CrowdData
+from data.knowledge_graph import KnowledgeGraph, FULL_GRAPH_PATH
+from language_processing.entity_relation_extraction import NamedEntityRecognizer, RelationExtractor
+
+# The chatbot of the current process. With the fork start method it is loaded once in the parent and shared with the
+# workers, otherwise every worker loads its own in init_worker.
+chatbot = None
+
+
+def load_chatbot(graph_path=FULL_GRAPH_PATH):
+    knowledge_graph = KnowledgeGraph(graph_path)
+    crowd_data = CrowdData()
+    knowledge_graph.apply_crowd_data(crowd_data)
+    return ChatBot(knowledge_graph, NamedEntityRecognizer(), RelationExtractor())
+
+
+def init_worker(graph_path=FULL_GRAPH_PATH):
+    global chatbot
+    # Several workers on one machine, one thread each avoids oversubscribing the cores (and deadlocks of torch's thread
+    # pool after forking).
+    import torch
+    torch.set_num_threads(1)
+    if chatbot is None:
+        chatbot = load_chatbot(graph_path)
+
+
+def answer_batch(questions, ner_batch_size=16):
+    """Answers a list of (id, question) pairs and returns one result record per question. NER runs for the whole batch
+    at once. If the batched NER fails, every question runs NER on its own."""
+    logger = logging.getLogger("batch_answering")
+    try:
+        chatbot.entity_extractor.prefetch([question for _, question in questions], batch_size=ner_batch_size)
+    except Exception:
+        logger.error("Batched NER failed, falling back to NER per question.", exc_info=True)
+
+    results = []
+    for question_id, question in questions:
+        start_time = time.perf_counter()
+        try:
+            answer = chatbot.respond_to(question)
+            error = None
+        except Exception as exception:
+            logger.error(f"Failed to answer question {question_id}.", exc_info=True)
+            answer = None
+            error = repr(exception)
+        results.append({
+            "id": question_id,
+            "question": question,
+            "answer": answer,
+            "error": error,
+            "seconds": round(time.perf_counter() - start_time, 4),
+            "worker": os.getpid(),
+        })
+    return results
+
+
+def read_questions(input_path):
+    """Reads (id, question) pairs from a JSONL file. Every line needs a 'question' field, the 'id' field defaults to
+    the line number."""
+    questions = []
+    with open(input_path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            questions.append((record.get("id", line_number), record["question"]))
+    return questions
+
+
+def read_answered_ids(output_path):
+    """Returns the ids of all questions that already have an answer in the output file, so an interrupted run can be
+    resumed. A partially written last line is cut off and questions that failed with an error are not counted, both
+    are answered again."""
+    answered_ids = set()
+    if not os.path.exists(output_path):
+        return answered_ids
+    with open(output_path, "rb+") as file:
+        content = file.read()
+        complete_length = content.rfind(b"\n") + 1
+        if complete_length < len(content):
+            file.truncate(complete_length)
+    for line in content[:complete_length].decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+            if record.get("error") is None:
+                answered_ids.add(record["id"])
+        except (ValueError, KeyError, AttributeError):
+            continue
+    return answered_ids
+
+
+def main():
+    global chatbot
+
+    parser = argparse.ArgumentParser(description="Answers the questions of a JSONL file offline and writes the answers "
+                                                 "with per-question timings to an output JSONL file.")
+    parser.add_argument("input", help="JSONL file with 'question' (and optionally 'id') fields")
+    parser.add_argument("output", help="JSONL file for the answers, already answered questions are skipped")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="number of processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="questions per task sent to a worker")
+    parser.add_argument("--graph", default=FULL_GRAPH_PATH,
+                        help="graph to load, e.g. a serving graph built with "
+                             "'python -m data.build_serving_graph build'")
+    parser.add_argument("--ner-batch-size", type=int, default=16, help="batch size of the NER pipeline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    logger = logging.getLogger("batch_answering")
+
+    questions = read_questions(args.input)
+    answered_ids = read_answered_ids(args.output)
+    pending = [(question_id, question) for question_id, question in questions if question_id not in answered_ids]
+    logger.info(f"{len(questions)} questions, {len(questions) - len(pending)} already answered, "
+                f"{len(pending)} to do.")
+    if not pending:
+        return
+
+    batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+
+    if args.workers == 1:
+        chatbot = load_chatbot(args.graph)
+        results_iterator = (answer_batch(batch, args.ner_batch_size) for batch in batches)
+        pool = None
+    else:
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            chatbot = load_chatbot(args.graph)
+        else:
+            logger.info("Fork is not available, every worker loads its own knowledge graph and models.")
+            context = multiprocessing.get_context("spawn")
+        pool = context.Pool(processes=args.workers, initializer=init_worker, initargs=(args.graph,))
+        results_iterator = pool.imap_unordered(partial(answer_batch, ner_batch_size=args.ner_batch_size), batches)
+
+    start_time = time.perf_counter()
+    answered = 0
+    total_seconds = 0.0
+    with open(args.output, "a", encoding="utf-8") as output_file:
+        try:
+            for results in results_iterator:
+                for result in results:
+                    output_file.write(json.dumps(result) + "\n")
+                    total_seconds += result["seconds"]
+                output_file.flush()
+                answered += len(results)
+                logger.info(f"Answered {answered}/{len(pending)} questions.")
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"Answered {answered} questions in {elapsed:.1f}s ({answered / elapsed:.2f} questions/s, "
+                f"{total_seconds / max(answered, 1):.3f}s per question on average).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,36 @@
 import logging
 import re
+import threading
 from typing import Iterable
 from pyparsing import ParseException
 import random
 
+from chatbot.conversation_context import ConversationContextStore, TasteProfile
+from chatbot.message_profiler import MessageProfiler
+
 
 class ChatBot:
-    def __init__(self, knowledge_graph, entity_extractor, relation_extractor, crowd_data):
+    def __init__(self, knowledge_graph, entity_extractor, relation_extractor):
         self.logger = logging.getLogger("chatbot")
         self.speakeasy = None
         self.rooms = []
         self.knowledge_graph = knowledge_graph
         self.entity_extractor = entity_extractor
         self.relation_extractor = relation_extractor
-        self.crowd_data = crowd_data
-
-    def respond_to(self, message):
+        self.contexts = ConversationContextStore()
+        self.data_lock = threading.Lock()
+        self.profiler = MessageProfiler()
+
+    def respond_to(self, message, room_id=None):
+        """Answers the message. If a room id is given, entities, relations and answers resolved earlier in the same room
+        are reused for follow-up questions. The whole message is answered with the same data, see swap_data. Slow or
+        sampled messages are profiled if profiling is switched on, see MessageProfiler."""
+        with self.data_lock:
+            return self.profiler.profile(message, self._respond_to, message, room_id)
+
+    def _respond_to(self, message, room_id):
         response = None
+        context = self.contexts.get(room_id)
 
         if self.is_sparql_query(message):
             try:
@@ -25,15 +39,25 @@ class ChatBot:
             except ParseException:
                 self.logger.debug(f"Could not parse {message}")
         if response is None:
-            if self.is_request_for_recommendation(message):
-                response = self.make_recommendation(message)
+            if self.is_request_for_recommendation(message, context):
+                response = self.make_recommendation(message, context)
             elif self.is_multimedia_question(message):
-                response = self.make_multimedia_response(message)
+                response = self.make_multimedia_response(message, context)
             else:
-                response = self.try_to_answer_question(message)
+                response = self.try_to_answer_question(message, context)
 
         return response
 
+    def swap_data(self, knowledge_graph):
+        """Replaces the knowledge graph (together with its crowd overlay). Waits for the message that is currently being
+        answered, so that it finishes on the old data. The room contexts refer to the old data and are cleared. Returns
+        the old knowledge graph."""
+        with self.data_lock:
+            old_knowledge_graph = self.knowledge_graph
+            self.knowledge_graph = knowledge_graph
+            self.contexts.clear()
+        return old_knowledge_graph
+
     def is_sparql_query(self, message):
         """Checks if the message might be a plain sparql query"""
         sparql_keywords = ["SELECT", "ASK", "WHERE", "PREFIX", "DESCRIBE", "CONSTRUCT"]
@@ -46,21 +70,51 @@ class ChatBot:
         response = f"I found the following query result: \n{query_result}."
         return response
 
-    def is_request_for_recommendation(self, message):
+    def is_request_for_recommendation(self, message, context=None):
+        """Checks if the message asks for recommendations. Once the room has a taste profile, follow-ups like "I also
+        like Frozen" or "any more?" continue the recommendation. Continuations only count in short messages or together
+        with "movie" or "recommend", so that questions like "Did Nolan direct anything else?" are still answered."""
         keywords = ["recommend", "suggest", "movies like", "should I watch", "similar", "any movies", "I like",
-                    "I enjoy", "other movies", "I'm into"]
+                    "I enjoy", "other movies", "I'm into", "also like", "also enjoy", "also love"]
 
         for keyword in keywords:
             if keyword.lower() in message.lower():
                 return True
 
+        if context is not None and context.taste.count > 0:
+            continuations = ["any more", "more like", "anything else", "something else", "another one"]
+            is_short = len(message.split()) <= 3
+            if is_short or "movie" in message.lower():
+                for continuation in continuations:
+                    if continuation in message.lower():
+                        return True
+
         return False
 
-    def make_recommendation(self, message):
-        entities, entity_uris = self.get_entities_and_uris(message)
-        results = self.unique_flatten(self.knowledge_graph.find_recommended_movies(entity_uris))[:3]
+    def make_recommendation(self, message, context=None):
+        """Adds the liked entities of the message to the taste profile of the room and recommends the movies closest
+        to it. Entities that are already part of the profile are not linked again and movies that were liked or
+        already recommended in the room are not recommended."""
+        taste = context.taste if context is not None else TasteProfile()
+        entities = self.unique_flatten(self.entity_extractor.extract_multiple_entities(message))
+        for entity in entities:
+            if entity in taste.entities:
+                continue
+            for entity_uri in self.unique_flatten(self.knowledge_graph.match_entity(entity)):
+                vector, movie_id = self.knowledge_graph.get_taste_vector(entity_uri)
+                if vector is not None:
+                    taste.add(vector, movie_id)
+                    if entity not in taste.entities:
+                        taste.entities.append(entity)
+
+        if taste.count == 0:
+            return "I could not find any movies you like, which movies do you enjoy?"
+
+        movies = self.knowledge_graph.find_movies_near(taste.get_vector(), taste.seen_movie_ids, top_n=3)
+        taste.seen_movie_ids.update(movie_id for movie_id, _ in movies)
+        results = [label for _, label in movies]
         # response = "I would recommend the following movies: " + ", ".join(results) + "."
-        response = f"Based on " + ", ".join(entities) + " I would recommend: " + ", ".join(results) + "."
+        response = f"Based on " + ", ".join(taste.entities) + " I would recommend: " + ", ".join(results) + "."
         return response
 
     def is_multimedia_question(self, message):
@@ -72,8 +126,8 @@ class ChatBot:
 
         return False
 
-    def make_multimedia_response(self, message):
-        entity, entity_uris, _, _ = self.get_entity_and_relation_uris(message)
+    def make_multimedia_response(self, message, context=None):
+        entity, entity_uris, _, _ = self.get_entity_and_relation_uris(message, context)
         for uri in entity_uris:
             imdb_id = self.knowledge_graph.get_imdb_id_from_entity(uri)
             if imdb_id:
@@ -85,26 +139,23 @@ class ChatBot:
 
         return "No relevant photos found."
 
-    def try_to_answer_question(self, message):
-        entities, entity_uris, relations, relation_uris = self.get_entity_and_relation_uris(message)
+    def try_to_answer_question(self, message, context=None):
+        entities, entity_uris, relations, relation_uris = self.get_entity_and_relation_uris(message, context)
         try:
             query_results = []
             embedding_results = []
             crowd_results = []
             for entity_uri in entity_uris:
                 for relation_uri in relation_uris:
-                    query_results.append(self.knowledge_graph.query_graph(entity_uri, relation_uri, False))
-                    query_results.append(self.knowledge_graph.query_graph(entity_uri, relation_uri, True))
-                    embedding_results.append(self.knowledge_graph.find_related_entities(entity_uri, relation_uri))
-                    crowd_result = self.crowd_data.get_result(entity_uri, relation_uri)
-                    if crowd_result is not None:
-                        obj, inter_rater, votes = crowd_result
-                        label = self.knowledge_graph.get_entity_label(obj)
-                        if not label:
-                            label = self.knowledge_graph.get_relation_label(obj)
-                            if not label:
-                                label = obj
-                        crowd_results.append((label, inter_rater, votes))
+                    answer = context.get_answer(entity_uri, relation_uri) if context is not None else None
+                    if answer is None:
+                        answer = self.answer_entity_relation(entity_uri, relation_uri)
+                        if context is not None:
+                            context.store_answer(entity_uri, relation_uri, answer)
+                    pair_query_results, pair_embedding_results, pair_crowd_results = answer
+                    query_results.extend(pair_query_results)
+                    embedding_results.append(pair_embedding_results)
+                    crowd_results.extend(pair_crowd_results)
 
             flat_query_results = self.unique_flatten(query_results)[:3]
             flat_embedding_results = self.unique_flatten(embedding_results)[:3]
@@ -137,22 +188,44 @@ class ChatBot:
 
         return response
 
-    def get_entities_and_uris(self, message):
-        entities = self.unique_flatten(self.entity_extractor.extract_multiple_entities(message))
-        entity_uris = self.unique_flatten(self.knowledge_graph.match_multiple_entities(entities))
-        return entities, entity_uris
-
-    def get_entity_and_relation_uris(self, message):
+    def answer_entity_relation(self, entity_uri, relation_uri):
+        """Looks up a single entity/relation pair in the graph (including the crowd overlay) and the embeddings."""
+        query_results = []
+        crowd_results = []
+        for obj in (False, True):
+            result_labels, crowd_answers = self.knowledge_graph.lookup(entity_uri, relation_uri, obj)
+            query_results.append(result_labels)
+            crowd_results.extend(crowd_answers)
+        embedding_results = self.knowledge_graph.find_related_entities(entity_uri, relation_uri)
+        return query_results, embedding_results, crowd_results
+
+    def get_entity_and_relation_uris(self, message, context=None):
+        """Extracts the entity and relation of the message and links them to URIs. With a room context, an entity or
+        relation that is missing or was already linked in the room is taken from the context instead of being matched
+        again."""
         entity = self.entity_extractor.extract_single_entity(message)
-        if entity:
+        if context is not None and context.entity_uris and (not entity or entity == context.entity):
+            self.logger.debug(f"Reusing entity '{context.entity}' from room context.")
+            entity = context.entity
+            entity_uris = context.entity_uris
+        elif entity:
             entity_uris = self.unique_flatten(self.knowledge_graph.match_entity(entity))
         else:
             entity_uris = []
         relation = self.relation_extractor.extract_relations(message, [entity])
-        if relation:
+        if context is not None and context.relation_uris and (not relation or relation == context.relation):
+            self.logger.debug(f"Reusing relation '{context.relation}' from room context.")
+            relation = context.relation
+            relation_uris = context.relation_uris
+        elif relation:
             relation_uris = self.unique_flatten(self.knowledge_graph.match_relation(relation))
         else:
             relation_uris = []
+
+        if context is not None:
+            context.entity, context.entity_uris = entity, entity_uris
+            context.relation, context.relation_uris = relation, relation_uris
+
         return entity, entity_uris, relation, relation_uris
 
     def flatten(self, nested_list):
@@ -36,7 +36,7 @@ class ChatroomManager(Speakeasy):
         self.logger.debug(f"Processing message in room {room.my_alias}:")
         message_string = message_object.message
         self.logger.debug(f"Message: {message_string}")
-        response = self.chatbot.respond_to(message_string)
+        response = self.chatbot.respond_to(message_string, room.room_id)
         self.logger.debug(f"Response: {response}")
         self.send_message(response, room)
         room.mark_as_processed(message_object)
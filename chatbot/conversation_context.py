@@ -0,0 +1,101 @@
+import logging
+import time
+from collections import OrderedDict
+
+
+class TasteProfile:
+    """Running sum of the embeddings of the movies (or other entities) a user said they like. Adding a seed costs O(d),
+    recommendations are made from the mean vector."""
+
+    def __init__(self):
+        self.entities = []
+        self.vector_sum = None
+        self.count = 0
+        self.seen_movie_ids = set()
+
+    def add(self, vector, movie_id=None):
+        if self.vector_sum is None:
+            self.vector_sum = vector.astype(float)
+        else:
+            self.vector_sum += vector
+        self.count += 1
+        if movie_id is not None:
+            self.seen_movie_ids.add(movie_id)
+
+    def get_vector(self):
+        return self.vector_sum / self.count if self.count else None
+
+
+class RoomContext:
+    """Everything that was already resolved in one room, so that follow-up questions can reuse it instead of running
+    entity/relation linking again."""
+
+    def __init__(self, max_answers=32):
+        self.entity = None
+        self.entity_uris = []
+        self.relation = None
+        self.relation_uris = []
+        self.max_answers = max_answers
+        self.answers = OrderedDict()
+        self.taste = TasteProfile()
+        self.last_access = time.monotonic()
+
+    def get_answer(self, entity_uri, relation_uri):
+        key = (entity_uri, relation_uri)
+        if key not in self.answers:
+            return None
+        self.answers.move_to_end(key)
+        return self.answers[key]
+
+    def store_answer(self, entity_uri, relation_uri, answer):
+        self.answers[(entity_uri, relation_uri)] = answer
+        self.answers.move_to_end((entity_uri, relation_uri))
+        while len(self.answers) > self.max_answers:
+            self.answers.popitem(last=False)
+
+
+class ConversationContextStore:
+    """Bounded store of RoomContext objects. Rooms are kept in least recently used order, the oldest rooms are dropped
+    once there are more than max_rooms of them or when they were not accessed for ttl seconds."""
+
+    def __init__(self, max_rooms=256, ttl=30 * 60):
+        self.logger = logging.getLogger("conversation_context")
+        self.max_rooms = max_rooms
+        self.ttl = ttl
+        self._contexts = OrderedDict()
+
+    def get(self, room_id):
+        """Returns the context of the given room, creating an empty one if the room is new or its context was evicted.
+        Returns None if no room is given."""
+        if room_id is None:
+            return None
+
+        self.evict_expired()
+        context = self._contexts.pop(room_id, None)
+        if context is None:
+            context = RoomContext()
+        context.last_access = time.monotonic()
+        self._contexts[room_id] = context
+
+        while len(self._contexts) > self.max_rooms:
+            evicted_room_id, _ = self._contexts.popitem(last=False)
+            self.logger.debug(f"Evicted context of room {evicted_room_id} (too many rooms).")
+
+        return context
+
+    def evict_expired(self):
+        """Drops the contexts of all rooms that have been idle for longer than the ttl. Since the contexts are ordered by
+        last access, only the front of the store has to be checked."""
+        now = time.monotonic()
+        while self._contexts:
+            room_id, context = next(iter(self._contexts.items()))
+            if now - context.last_access < self.ttl:
+                break
+            del self._contexts[room_id]
+            self.logger.debug(f"Evicted context of room {room_id} (idle).")
+
+    def clear(self):
+        self._contexts.clear()
+
+    def __len__(self):
+        return len(self._contexts)
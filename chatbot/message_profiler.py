@@ -0,0 +1,149 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+
+class MessageProfiler:
+    """Profiles single messages with cProfile and optionally tracemalloc. Profiling is off by default and is switched on
+    at runtime with configure or by writing the control file, e.g. logs/profiling.json containing {"sample_rate": 0.05,
+    "latency_threshold": 5.0, "trace_allocations": true}. A message is profiled if it is sampled or, when a latency
+    threshold is set, if answering it took longer than the threshold. Since it is only known afterwards whether a
+    message was slow, a latency threshold makes every message run under cProfile (and under tracemalloc if
+    trace_allocations is on), which slows down all traffic, not only the slow messages. Deleting the control file
+    switches profiling off again, an invalid control file keeps the previous settings. Profiles are written to a
+    directory next to the log files, only the newest max_profiles are kept."""
+
+    def __init__(self, directory="logs/profiles", control_file="logs/profiling.json", max_profiles=50):
+        self.logger = logging.getLogger("message_profiler")
+        self.directory = directory
+        self.control_file = control_file
+        self.max_profiles = max_profiles
+        self.sample_rate = 0.0
+        self.latency_threshold = None
+        self.trace_allocations = False
+        self._control_file_mtime = None
+
+    def configure(self, sample_rate=0.0, latency_threshold=None, trace_allocations=False):
+        """Sets the profiling settings. Raises a ValueError (and keeps the previous settings) for invalid values."""
+        try:
+            sample_rate = float(sample_rate)
+            if latency_threshold is not None:
+                latency_threshold = float(latency_threshold)
+        except (TypeError, ValueError):
+            raise ValueError("sample_rate and latency_threshold have to be numbers.")
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate has to be between 0 and 1, got {sample_rate}.")
+        if latency_threshold is not None and not latency_threshold >= 0:
+            raise ValueError(f"latency_threshold must not be negative, got {latency_threshold}.")
+        if isinstance(trace_allocations, str):
+            raise ValueError(f"trace_allocations has to be true or false, got '{trace_allocations}'.")
+        trace_allocations = bool(trace_allocations)
+
+        self.sample_rate = sample_rate
+        self.latency_threshold = latency_threshold
+        self.trace_allocations = trace_allocations
+        self.logger.info(f"Profiling configured: sample rate {sample_rate}, latency threshold {latency_threshold}, "
+                         f"allocation tracing {trace_allocations}.")
+
+    def is_enabled(self):
+        return self.sample_rate > 0 or self.latency_threshold is not None
+
+    def check_control_file(self):
+        """Reconfigures the profiler if the control file was created, changed or deleted since the last check."""
+        try:
+            mtime = os.stat(self.control_file).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._control_file_mtime:
+            return
+        self._control_file_mtime = mtime
+
+        if mtime is None:
+            self.configure()
+            return
+        try:
+            with open(self.control_file) as file:
+                settings = json.load(file)
+            if not isinstance(settings, dict):
+                raise ValueError("The profiling settings have to be a JSON object.")
+            unknown_keys = set(settings) - {"sample_rate", "latency_threshold", "trace_allocations"}
+            if unknown_keys:
+                raise ValueError(f"Unknown profiling settings: {', '.join(sorted(unknown_keys))}.")
+            self.configure(**settings)
+        except (OSError, ValueError) as error:
+            self.logger.error(f"Could not read profiling settings from {self.control_file}, keeping the previous "
+                              f"settings: {error}")
+
+    def profile(self, message, function, *args):
+        """Calls function(*args) to answer the message and profiles the call if profiling is enabled."""
+        self.check_control_file()
+        if not self.is_enabled():
+            return function(*args)
+
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.latency_threshold is None:
+            return function(*args)
+
+        trace_allocations = self.trace_allocations and not tracemalloc.is_tracing()
+        if trace_allocations:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        start_time = time.perf_counter()
+        profiler.enable()
+        try:
+            return function(*args)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start_time
+            snapshot = None
+            if trace_allocations:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+            try:
+                if sampled:
+                    self.write_profile(message, elapsed, "sampled", profiler, snapshot)
+                elif elapsed >= self.latency_threshold:
+                    self.write_profile(message, elapsed, f"slower than {self.latency_threshold}s", profiler, snapshot)
+            except OSError:
+                # Profiling must never break answering the message
+                self.logger.error(f"Could not write the profile to {self.directory}.", exc_info=True)
+
+    def write_profile(self, message, elapsed, reason, profiler, snapshot=None):
+        """Writes the raw profile (.prof, readable with pstats or snakeviz) and a text summary (.txt) and removes the
+        oldest profiles."""
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
+        base_name = os.path.join(self.directory, f"message_{timestamp}")
+        profiler.dump_stats(f"{base_name}.prof")
+
+        stats_stream = io.StringIO()
+        pstats.Stats(profiler, stream=stats_stream).sort_stats("cumulative").print_stats(30)
+        with open(f"{base_name}.txt", "w", encoding="utf-8") as file:
+            file.write(f"Message: {message}\n")
+            file.write(f"Elapsed: {elapsed:.3f}s ({reason})\n\n")
+            file.write(stats_stream.getvalue())
+            if snapshot is not None:
+                file.write("\nTop allocations:\n")
+                for statistic in snapshot.statistics("lineno")[:20]:
+                    file.write(f"{statistic}\n")
+
+        self.logger.info(f"Wrote profile of message ({elapsed:.3f}s, {reason}) to {base_name}.prof")
+        self.rotate()
+
+    def rotate(self):
+        profiles = sorted(file_name for file_name in os.listdir(self.directory) if file_name.endswith(".prof"))
+        for file_name in profiles[:-self.max_profiles]:
+            base_name = os.path.join(self.directory, file_name[:-len(".prof")])
+            for extension in (".prof", ".txt"):
+                try:
+                    os.remove(base_name + extension)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,227 @@
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import re
+import time
+from collections import Counter
+from datetime import datetime
+
+from data.knowledge_graph import FULL_GRAPH_PATH
+
+SERVING_GRAPH_PATH = "data/14_graph.serving.nt"
+
+# Predicates the code uses directly: labels for all answers and IMDb ids for the multimedia answers.
+FIXED_PREDICATES = [
+    "http://www.w3.org/2000/01/rdf-schema#label",
+    "http://www.wikidata.org/prop/direct/P345",
+]
+
+# Matches the predicate of the queries logged by KnowledgeGraph.lookup
+LOGGED_QUERY_PATTERN = re.compile(r"Executing query: SELECT DISTINCT \?x WHERE \{ "
+                                  r"(?:\?x <([^>]+)>|<[^>]+> <([^>]+)> \?x)")
+
+
+def get_relation_predicates(relation_to_uri_path="data/relation_to_uri.pkl"):
+    """Returns all predicates that match_relation can return."""
+    with open(relation_to_uri_path, "rb") as file:
+        relation_to_uri = pickle.load(file)
+    return {str(uri) for uris in relation_to_uri.values() for uri in uris}
+
+
+def get_logged_predicates(log_paths):
+    """Returns the predicates of all graph lookups in the given chatbot log files."""
+    predicates = set()
+    for log_path in log_paths:
+        with open(log_path, encoding="utf-8", errors="replace") as file:
+            for line in file:
+                match = LOGGED_QUERY_PATTERN.search(line)
+                if match:
+                    predicates.add(match.group(1) or match.group(2))
+    return predicates
+
+
+def get_predicate(line):
+    """Returns the predicate URI of an N-Triples line, or None if the line is not a simple triple."""
+    parts = line.split(None, 2)
+    if len(parts) < 3 or not parts[1].startswith("<") or not parts[1].endswith(">"):
+        return None
+    return parts[1][1:-1]
+
+
+def load_graph(graph_path):
+    """Parses the graph with rdflib like KnowledgeGraph does and returns the parse time in seconds and the peak resident
+    memory of the process in MB."""
+    import resource
+    from rdflib import Graph
+
+    start_time = time.perf_counter()
+    Graph().parse(graph_path, format="turtle")
+    seconds = time.perf_counter() - start_time
+    # ru_maxrss is in kilobytes on Linux
+    return round(seconds, 1), round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure_load(graph_path):
+    """Measures load_graph in a fresh process, so that the peak memory belongs to this graph alone."""
+    with multiprocessing.get_context("spawn").Pool(processes=1) as pool:
+        seconds, max_rss_mb = pool.apply(load_graph, (graph_path,))
+    return {"parse_seconds": seconds, "max_rss_mb": max_rss_mb}
+
+
+def build(graph_path, output_path, manifest_path, predicates, measure=False):
+    """Copies the triples of the graph whose predicate is in predicates to output_path and writes a manifest. The graph
+    is streamed line by line, so the full graph never has to be loaded. Lines that cannot be parsed are kept. With
+    measure, the manifest also records how long parsing each graph takes and how much memory it needs."""
+    kept = Counter()
+    dropped = Counter()
+    unparsed = 0
+    with open(graph_path, encoding="utf-8") as graph_file, open(output_path, "w", encoding="utf-8") as output_file:
+        for line in graph_file:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            predicate = get_predicate(line)
+            if predicate is None:
+                unparsed += 1
+                output_file.write(line)
+            elif predicate in predicates:
+                kept[predicate] += 1
+                output_file.write(line)
+            else:
+                dropped[predicate] += 1
+
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": graph_path,
+        "source_size": os.path.getsize(graph_path),
+        "source_mtime": os.path.getmtime(graph_path),
+        "serving_graph": output_path,
+        "serving_graph_size": os.path.getsize(output_path),
+        "triples_kept": sum(kept.values()) + unparsed,
+        "triples_dropped": sum(dropped.values()),
+        "unparsed_lines_kept": unparsed,
+        "predicates_kept": dict(kept.most_common()),
+        "predicates_dropped": dict(dropped.most_common()),
+        "predicates_requested_but_missing": sorted(predicates - set(kept)),
+    }
+    if measure:
+        manifest["load_source"] = measure_load(graph_path)
+        manifest["load_serving_graph"] = measure_load(output_path)
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def compare(full_answers_path, serving_answers_path, examples=10):
+    """Compares two answer files of batch_answering.py (one run on the full graph, one on the serving graph) and
+    returns a report of the answers that changed. Questions that failed with an error on either graph are counted
+    separately and not compared. Plain SPARQL questions (ChatBot.execute_plain_sparql_query) can use any predicate, so
+    their answers are expected to change whenever the query uses a dropped predicate."""
+
+    def read_answers(path):
+        with open(path, encoding="utf-8") as file:
+            return {record["id"]: record for record in map(json.loads, filter(str.strip, file))}
+
+    full_answers = read_answers(full_answers_path)
+    serving_answers = read_answers(serving_answers_path)
+    answered_ids = [question_id for question_id in full_answers if question_id in serving_answers]
+    errored = {question_id for question_id in answered_ids
+               if full_answers[question_id].get("error") is not None
+               or serving_answers[question_id].get("error") is not None}
+    common_ids = [question_id for question_id in answered_ids if question_id not in errored]
+    changed = [question_id for question_id in common_ids
+               if full_answers[question_id]["answer"] != serving_answers[question_id]["answer"]]
+
+    def mean_seconds(answers):
+        return sum(answers[question_id]["seconds"] for question_id in common_ids) / max(len(common_ids), 1)
+
+    return {
+        "compared": len(common_ids),
+        "errored": len(errored),
+        "changed": len(changed),
+        "changed_fraction": round(len(changed) / max(len(common_ids), 1), 4),
+        "mean_seconds_full": round(mean_seconds(full_answers), 4),
+        "mean_seconds_serving": round(mean_seconds(serving_answers), 4),
+        "examples": [
+            {
+                "id": question_id,
+                "question": full_answers[question_id]["question"],
+                "full": full_answers[question_id]["answer"],
+                "serving": serving_answers[question_id]["answer"],
+            }
+            for question_id in changed[:examples]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds a pruned serving graph that only contains the predicates the "
+                                                 "chatbot can use, or compares the answers of both graphs. Answers to "
+                                                 "plain SPARQL queries may change, since a query can use any "
+                                                 "predicate. Run it from the repository root with 'python -m "
+                                                 "data.build_serving_graph build|compare'.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="build the serving graph and its manifest")
+    build_parser.add_argument("--graph", default=FULL_GRAPH_PATH, help="full graph in N-Triples format")
+    build_parser.add_argument("--output", default=SERVING_GRAPH_PATH, help="path of the serving graph")
+    build_parser.add_argument("--manifest", help="path of the manifest, defaults to the output path with .json")
+    build_parser.add_argument("--query-logs", nargs="*", default=[],
+                              help="chatbot log files (glob patterns) whose graph lookups add predicates")
+    build_parser.add_argument("--logged-only", action="store_true",
+                              help="keep only the fixed predicates and those found in the query logs, "
+                                   "not all predicates of relation_to_uri.pkl")
+    build_parser.add_argument("--measure-load", action="store_true",
+                              help="parse both graphs with rdflib in a fresh process and record the parse time and "
+                                   "peak memory in the manifest (slow for the full graph)")
+
+    compare_parser = subparsers.add_parser("compare", help="compare batch_answering.py outputs of both graphs")
+    compare_parser.add_argument("full_answers", help="answers on the full graph")
+    compare_parser.add_argument("serving_answers", help="answers on the serving graph")
+    compare_parser.add_argument("--output", help="write the report as JSON to this file")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    logger = logging.getLogger("build_serving_graph")
+
+    if args.command == "build":
+        log_paths = [path for pattern in args.query_logs for path in glob.glob(pattern)]
+        logged_predicates = get_logged_predicates(log_paths)
+        predicates = set(FIXED_PREDICATES) | logged_predicates
+        if not args.logged_only:
+            predicates |= get_relation_predicates()
+        logger.info(f"Keeping {len(predicates)} predicates ({len(logged_predicates)} from {len(log_paths)} logs).")
+
+        start_time = time.perf_counter()
+        manifest_path = args.manifest or os.path.splitext(args.output)[0] + ".json"
+        manifest = build(args.graph, args.output, manifest_path, predicates, args.measure_load)
+        total = manifest["triples_kept"] + manifest["triples_dropped"]
+        kept_fraction = manifest["triples_kept"] / max(total, 1)
+        logger.info(f"Kept {manifest['triples_kept']} of {total} triples ({kept_fraction:.1%}, "
+                    f"{manifest['serving_graph_size'] / manifest['source_size']:.1%} of the source size) in "
+                    f"{time.perf_counter() - start_time:.1f}s. Manifest written to {manifest_path}.")
+        if kept_fraction > 0.95:
+            logger.warning(f"Only {1 - kept_fraction:.1%} of the triples were pruned, the serving graph will load "
+                           f"about as slowly as the full graph. Try --logged-only with query logs.")
+        if args.measure_load:
+            logger.info(f"Loading the full graph took {manifest['load_source']['parse_seconds']}s and "
+                        f"{manifest['load_source']['max_rss_mb']}MB, the serving graph "
+                        f"{manifest['load_serving_graph']['parse_seconds']}s and "
+                        f"{manifest['load_serving_graph']['max_rss_mb']}MB.")
+    else:
+        report = compare(args.full_answers, args.serving_answers)
+        logger.info(f"{report['changed']} of {report['compared']} answers changed "
+                    f"({report['changed_fraction']:.1%}), {report['errored']} questions failed with an error.")
+        for example in report["examples"]:
+            logger.info(f"Changed answer for '{example['question']}':\n  full: {example['full']}\n"
+                        f"  serving: {example['serving']}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 import logging
+import re
+
 import pandas as pd
 from statsmodels.stats.inter_rater import fleiss_kappa
 
+from data.crowd_overlay import CrowdOverlay, CrowdTriple, ADDED, REMOVED, CORRECTED
+
 
 class CrowdData:
     def __init__(self):
@@ -47,42 +51,74 @@ class CrowdData:
         distribution = specific_task['AnswerLabel'].value_counts().to_dict()
         return distribution
 
-    def get_result(self, entity_uri, relation_uri):
-        short_entity_uri = self.to_short_uri(entity_uri)
-        short_relation_uri = self.to_short_uri(relation_uri)
-
-        self.logger.debug(f"Searching for entity: '{short_entity_uri}', relation: '{short_relation_uri}'")
-
-        hit_data = self.cleaned_data[
-            (self.cleaned_data['Input1ID'] == short_entity_uri) &
-            (self.cleaned_data['Input2ID'] == short_relation_uri)
+    @staticmethod
+    def weighted_vote(group):
+        correct_votes = group[group['AnswerLabel'] == 'CORRECT']
+        incorrect_votes = group[group['AnswerLabel'] == 'INCORRECT']
+        weighted_correct = correct_votes['LifetimeApprovalRate'].sum()
+        weighted_incorrect = incorrect_votes['LifetimeApprovalRate'].sum()
+        return weighted_correct - weighted_incorrect
+
+    def compile_overlay(self, get_label):
+        """Compiles the crowd judgements into a CrowdOverlay. Triples with a positive weighted vote are added, triples
+        with a negative weighted vote are removed and tied votes are left out, so the graph is only overridden when the
+        crowd actually rejected a triple. If the workers that rejected a triple agree on a fix, the fixed triple is
+        added as corrected. Tasks that judge the same triple with the same outcome are merged into one crowd triple.
+        get_label resolves a URI to its label, the labels are stored in the overlay so no lookups are needed later."""
+        overlay = CrowdOverlay()
+
+        def label(item):
+            return get_label(item) or item
+
+        for hit_id, hit_data in self.cleaned_data.groupby('HITId'):
+            first_row = hit_data.iloc[0]
+            subject, predicate, obj = (self.to_full_uri(first_row[column])
+                                       for column in ['Input1ID', 'Input2ID', 'Input3ID'])
+            inter_rater = self.kappa_values[first_row['HITTypeId']]
+            distribution = self.get_answer_distribution(hit_id)
+
+            weighted_vote = self.weighted_vote(hit_data)
+            if weighted_vote > 0:
+                overlay.add(CrowdTriple(subject, predicate, obj, label(subject), label(obj), ADDED, inter_rater,
+                                        distribution))
+                continue
+            if weighted_vote == 0:
+                self.logger.debug(f"Tied crowd vote on {subject} {predicate} {obj}, not applied.")
+                continue
+
+            overlay.add(CrowdTriple(subject, predicate, obj, label(subject), label(obj), REMOVED, inter_rater,
+                                    distribution))
+            fix = self.get_fix(hit_data)
+            if fix is not None:
+                position, value = fix
+                if position == "Subject":
+                    subject = value
+                elif position == "Predicate":
+                    predicate = value
+                else:
+                    obj = value
+                overlay.add(CrowdTriple(subject, predicate, obj, label(subject), label(obj), CORRECTED, inter_rater,
+                                        distribution))
+
+        self.logger.info(f"Compiled crowd overlay with {len(overlay)} triples.")
+        return overlay
+
+    def get_fix(self, hit_data):
+        """Returns the most common (position, full value) fix suggested by the workers that rejected the triple, or None
+        if they did not suggest a usable fix."""
+        fixes = hit_data[
+            (hit_data['AnswerLabel'] == 'INCORRECT') &
+            (hit_data['FixPosition'].isin(['Subject', 'Predicate', 'Object'])) &
+            (hit_data['FixValue'].notna())
             ]
-
-        if hit_data.empty:
-            self.logger.debug(f"No crowd data found.")
+        if fixes.empty:
             return None
 
-        def weighted_vote(group):
-            correct_votes = group[group['AnswerLabel'] == 'CORRECT']
-            incorrect_votes = group[group['AnswerLabel'] == 'INCORRECT']
-            weighted_correct = correct_votes['LifetimeApprovalRate'].sum()
-            weighted_incorrect = incorrect_votes['LifetimeApprovalRate'].sum()
-            return weighted_correct - weighted_incorrect
-
-        aggregated = hit_data.groupby('Input3ID').apply(weighted_vote)
-
-        result = aggregated.idxmax()
-        batch_id = hit_data.iloc[0]['HITTypeId']
-        inter_rater = self.kappa_values[batch_id]
-        hit_id = hit_data.iloc[0]['HITId']
-        distribution = self.get_answer_distribution(hit_id)
-        votes = ", ".join(
-            [f"{count} {label.lower()} vote{'s' if count > 1 else ''}" for label, count in distribution.items()])
-
-        result = self.to_full_uri(result)
-        self.logger.debug(f"Found crowd data result {result}.")
-
-        return result, inter_rater, votes
+        position, value = fixes.groupby(['FixPosition', 'FixValue']).size().idxmax()
+        value = str(value).strip()
+        if re.fullmatch(r"[QP]\d+", value):
+            value = ("wdt:" if position == "Predicate" else "wd:") + value
+        return position, self.to_full_uri(value)
 
     def to_full_uri(self, item):
         item = str(item)
@@ -90,12 +126,6 @@ class CrowdData:
             item = item.replace(short, prefix)
         return item
 
-    def to_short_uri(self, item):
-        item = str(item)
-        for short, prefix in self.short_to_prefix.items():
-            item = item.replace(prefix, short)
-        return item
-
 
 # Example usage
 if __name__ == "__main__":
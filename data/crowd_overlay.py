@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+ADDED = "added"
+REMOVED = "removed"
+CORRECTED = "corrected"
+
+
+class CrowdTriple:
+    """A triple judged by the crowd, with the labels of its subject and object already resolved. The status is ADDED
+    for triples the crowd agreed with, REMOVED for triples the crowd rejected and CORRECTED for the fixed version of a
+    rejected triple. distribution counts the answers of the workers per answer label, inter_rater is the mean
+    inter-rater agreement of the tasks that judged the triple."""
+
+    def __init__(self, subject, predicate, obj, subject_label, object_label, status, inter_rater, distribution):
+        self.subject = subject
+        self.predicate = predicate
+        self.object = obj
+        self.subject_label = subject_label
+        self.object_label = object_label
+        self.status = status
+        self.inter_rater = inter_rater
+        self.distribution = dict(distribution)
+        self.tasks = 1
+
+    def get_key(self):
+        return self.subject, self.predicate, self.object, self.status
+
+    def merge(self, other):
+        """Merges the judgement of another task about the same triple with the same status into this one."""
+        for label, count in other.distribution.items():
+            self.distribution[label] = self.distribution.get(label, 0) + count
+        tasks = self.tasks + other.tasks
+        self.inter_rater = (self.inter_rater * self.tasks + other.inter_rater * other.tasks) / tasks
+        self.tasks = tasks
+
+    @property
+    def votes(self):
+        return ", ".join(
+            [f"{count} {label.lower()} vote{'s' if count > 1 else ''}" for label, count in self.distribution.items()])
+
+    def __repr__(self):
+        return f"CrowdTriple({self.subject}, {self.predicate}, {self.object}, {self.status})"
+
+
+class CrowdOverlay:
+    """Crowd triples indexed by (subject, predicate) and by (predicate, object), like the triple index of the graph,
+    so that graph lookups in either direction can apply the crowd's judgements directly."""
+
+    def __init__(self):
+        self._by_subject_predicate = defaultdict(list)
+        self._by_predicate_object = defaultdict(list)
+        self._by_key = {}
+        self.size = 0
+
+    def add(self, crowd_triple):
+        """Adds the crowd triple, or merges it into the crowd triple with the same triple and status."""
+        existing = self._by_key.get(crowd_triple.get_key())
+        if existing is not None:
+            existing.merge(crowd_triple)
+            return
+        self._by_key[crowd_triple.get_key()] = crowd_triple
+        self._by_subject_predicate[(crowd_triple.subject, crowd_triple.predicate)].append(crowd_triple)
+        self._by_predicate_object[(crowd_triple.predicate, crowd_triple.object)].append(crowd_triple)
+        self.size += 1
+
+    def get_objects(self, subject, predicate):
+        return self._by_subject_predicate.get((str(subject), str(predicate)), [])
+
+    def get_subjects(self, predicate, obj):
+        return self._by_predicate_object.get((str(predicate), str(obj)), [])
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,111 @@
+import logging
+import os
+import signal
+import threading
+
+from data.crowd_data import CrowdData
+from data.knowledge_graph import KnowledgeGraph, FULL_GRAPH_PATH
+
+# Watched besides the graph itself. data/entity_to_uri.pkl is not watched, KnowledgeGraph rewrites it on every load.
+WATCHED_FILES = [
+    "data/entity_embeds.npy",
+    "data/entity_to_id.pkl",
+    "data/movie_embeds.npy",
+    "data/movie_to_id.pkl",
+    "data/relation_embeds.npy",
+    "data/relation_to_id.pkl",
+    "data/relation_to_uri.pkl",
+    "data/images.json",
+    "data/crowd_data.tsv",
+]
+
+
+class HotReloader:
+    """Rebuilds the KnowledgeGraph and CrowdData in a background thread and hands the new objects to on_reload once they
+    are fully loaded. A reload is triggered by SIGHUP (where available), by a change of one of the watched data files or
+    by calling request_reload."""
+
+    def __init__(self, on_reload, graph_path=FULL_GRAPH_PATH, watched_files=None, poll_interval=10):
+        self.logger = logging.getLogger("hot_reload")
+        self.on_reload = on_reload
+        self.graph_path = graph_path
+        self.watched_files = [graph_path] + (watched_files if watched_files is not None else WATCHED_FILES)
+        self.poll_interval = poll_interval
+        self._reload_requested = threading.Event()
+        self._stop_event = threading.Event()
+        self._modification_times = self.get_modification_times()
+        self.loaded_modification_times = dict(self._modification_times)
+        self._reload_thread = threading.Thread(target=self._reload_loop, name="hot-reload", daemon=True)
+        self._watch_thread = threading.Thread(target=self._watch_loop, name="hot-reload-watch", daemon=True)
+
+    def start(self):
+        """Starts the reload and file watch threads and installs the signal handler. Has to be called from the main
+        thread if the signal handler should be installed."""
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+        self._reload_thread.start()
+        if self.poll_interval:
+            self._watch_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._reload_requested.set()
+
+    def request_reload(self):
+        self._reload_requested.set()
+
+    def get_modification_times(self):
+        modification_times = {}
+        for file_path in self.watched_files:
+            try:
+                modification_times[file_path] = os.stat(file_path).st_mtime
+            except FileNotFoundError:
+                modification_times[file_path] = None
+        return modification_times
+
+    def _watch_loop(self):
+        """Polls the watched files. A reload is only requested once the files have not changed for a whole poll
+        interval, so that files that are still being written are not picked up."""
+        changed = False
+        while not self._stop_event.wait(self.poll_interval):
+            modification_times = self.get_modification_times()
+            if modification_times != self._modification_times:
+                self.logger.info("Data files changed, waiting for them to settle...")
+                self._modification_times = modification_times
+                changed = True
+            elif changed:
+                changed = False
+                self.request_reload()
+
+    def _reload_loop(self):
+        while True:
+            self._reload_requested.wait()
+            if self._stop_event.is_set():
+                return
+            self._reload_requested.clear()
+            try:
+                self.reload()
+            except Exception:
+                # Keep the thread alive, otherwise all later reloads would be ignored
+                self.logger.error("Reloading the data failed.", exc_info=True)
+
+    def reload(self):
+        """Builds a new snapshot of the data. If loading fails, the old data stays in use. The modification times are
+        read before loading, so a file that changes while loading is picked up by the watch thread and triggers
+        another reload."""
+        modification_times = self.get_modification_times()
+        changed_files = [file_path for file_path, mtime in modification_times.items()
+                         if mtime != self.loaded_modification_times.get(file_path)]
+        self.logger.info(f"Reloading knowledge graph and crowd data in the background (changed files: "
+                         f"{', '.join(changed_files) or 'none'})...")
+        try:
+            knowledge_graph = KnowledgeGraph(self.graph_path)
+            crowd_data = CrowdData()
+            knowledge_graph.apply_crowd_data(crowd_data)
+        except Exception:
+            self.logger.error("Reloading the data failed, keeping the current data.", exc_info=True)
+            return
+
+        self.on_reload(knowledge_graph, crowd_data)
+        self.loaded_modification_times = modification_times
+        self.logger.info("Finished reloading knowledge graph and crowd data.")
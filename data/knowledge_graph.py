@@ -9,13 +9,21 @@ from sklearn.metrics import pairwise_distances
 import pickle
 from thefuzz import process
 
+from data.crowd_overlay import REMOVED
+
+
+FULL_GRAPH_PATH = "data/14_graph.nt"
+
 
 class KnowledgeGraph(Graph):
-    def __init__(self):
+    def __init__(self, graph_path=FULL_GRAPH_PATH):
+        """Loads the graph from graph_path, which is either the full graph or a pruned serving graph built with
+        data/build_serving_graph.py, and the embeddings and lookup tables."""
         super().__init__()
         self.logger = logging.getLogger("knowledge_graph")
-        self.logger.info("Setting up knowledge graph...")
-        self.parse("data/14_graph.nt", format="turtle")
+        self.logger.info(f"Setting up knowledge graph from {graph_path}...")
+        self.graph_path = graph_path
+        self.parse(graph_path, format="turtle")
 
         self.entity_embeddings = np.load("data/entity_embeds.npy")
         self._entity_to_id = pickle.load(open("data/entity_to_id.pkl", "rb"))
@@ -29,6 +37,8 @@ class KnowledgeGraph(Graph):
         self._relation_to_id = pickle.load(open("data/relation_to_id.pkl", "rb"))
         self._id_to_relation = {id: relation for relation, id in self._relation_to_id.items()}
 
+        self._relation_objects = self.build_relation_candidates()
+
         self._relation_to_uri = pickle.load(open("data/relation_to_uri.pkl", "rb"))
         self._uri_to_relation = {}
         for relation, uris in self._relation_to_uri.items():
@@ -44,8 +54,23 @@ class KnowledgeGraph(Graph):
         with open('data/images.json') as f:
             self.images_json = json.load(f)
 
+        self.crowd_overlay = None
+
         self.logger.info("Finished setting up knowledge graph.")
 
+    def build_relation_candidates(self):
+        """For every relation with an embedding, collects the ids of the entities that occur as objects of the relation
+        in the graph. Link prediction only has to search these entities."""
+        relation_objects = {}
+        for relation, rel_id in self._relation_to_id.items():
+            object_ids = {self._entity_to_id.get(obj) for obj in self.objects(None, URIRef(relation))}
+            object_ids.discard(None)
+            if object_ids:
+                relation_objects[rel_id] = np.array(sorted(object_ids))
+
+        self.logger.info(f"Built candidate entities for {len(relation_objects)} relations.")
+        return relation_objects
+
     def execute_sparql_query(self, query):
         query_result = [str(s) for s, in self.query(query)]
         return query_result
@@ -72,41 +97,56 @@ class KnowledgeGraph(Graph):
         self.logger.debug(f"Matched relations to '{relation}': {matched_relations}")
         return [self._relation_to_uri[entity] for entity, _ in matched_relations]
 
-    def find_recommended_movies(self, entity_uris, top_n=5, top_n_per_movie=10):
-        similar_movies_list = []
-        for entity_uri in entity_uris:
-            ent_id = self._entity_to_id.get(rdflib.term.URIRef(entity_uri))
-            if ent_id is None:
-                continue
-            similar_movies = \
-                self.get_similar_entities(self.entity_embeddings[ent_id], self.movie_embeddings, self._id_to_movie,
-                                          top_n_per_movie)[["Entity", "Label", "Score"]]
-            similar_movies["Count"] = 0
-            similar_movies = similar_movies[similar_movies["Score"] != 0]
-            similar_movies_list.append(similar_movies)
-        if not similar_movies_list:
-            return []
-        all_similar_movies = pd.concat(similar_movies_list, ignore_index=True)
-
-        # Remove original entities
-        entity_ids = [uri.split('/')[-1] for uri in entity_uris]
-        all_similar_movies = all_similar_movies[~all_similar_movies["Entity"].isin(entity_ids)]
-
-        # Count how many times the same movie appears
-        label_counts = all_similar_movies["Label"].value_counts()
-        all_similar_movies["Count"] = all_similar_movies["Label"].map(label_counts)
-
-        all_similar_movies = (all_similar_movies
-                              .loc[all_similar_movies.groupby("Label")[
-            "Score"].idxmin()]  # remove duplicates, only keep the ones with lowest score
-                              .sort_values(by=["Count", "Score"],
-                                           ascending=[False, True])  # sort by count first, then score
-                              .head(top_n)  # only take the top n movies
-                              )
-
-        return all_similar_movies["Label"].tolist()
+    def apply_crowd_data(self, crowd_data):
+        """Compiles the crowd data into an overlay that is applied to all graph lookups."""
+        self.crowd_overlay = crowd_data.compile_overlay(self.get_label)
+
+    def get_taste_vector(self, entity_uri):
+        """Returns the embedding used for the entity in taste profiles and its movie id. Movies use their movie
+        embedding, other entities their entity embedding (with movie id None). Returns (None, None) for unknown
+        entities."""
+        movie_id = self._movie_to_id.get(rdflib.term.URIRef(entity_uri))
+        if movie_id is not None:
+            return self.movie_embeddings[movie_id], movie_id
+        ent_id = self._entity_to_id.get(rdflib.term.URIRef(entity_uri))
+        if ent_id is not None:
+            return self.entity_embeddings[ent_id], None
+        return None, None
+
+    def find_movies_near(self, vector, exclude_movie_ids=(), top_n=3):
+        """Returns (movie id, label) of the top_n movies closest to the vector, leaving out the excluded movies and
+        movies whose label was already returned."""
+        dist = pairwise_distances(vector.reshape(1, -1), self.movie_embeddings).reshape(-1)
+        if exclude_movie_ids:
+            dist[list(exclude_movie_ids)] = np.inf
+
+        # Take some extra candidates since movies without label or with duplicate labels are skipped
+        n_candidates = min(len(dist), max(top_n * 4, top_n + len(exclude_movie_ids)))
+        candidates = np.argpartition(dist, n_candidates - 1)[:n_candidates]
+        candidates = candidates[dist[candidates].argsort()]
+
+        movies = []
+        labels = set()
+        for movie_id in candidates:
+            if np.isinf(dist[movie_id]):
+                break
+            label = self.get_entity_label(str(self._id_to_movie[movie_id]))
+            if label and label not in labels:
+                movies.append((int(movie_id), label))
+                labels.add(label)
+            if len(movies) == top_n:
+                break
+        return movies
 
     def query_graph(self, entity_uri, relation_uri, obj=True):
+        result_labels, _ = self.lookup(entity_uri, relation_uri, obj)
+        return result_labels
+
+    def lookup(self, entity_uri, relation_uri, obj=True):
+        """Queries the graph for the subjects (obj=True) or objects (obj=False) related to the entity by the relation and
+        returns their labels, adjusted by the crowd overlay: triples rejected by the crowd are left out, triples added or
+        corrected by the crowd are included. Also returns (label, inter-rater agreement, votes) for every crowd triple
+        that contributed an answer."""
         rdfs = Namespace("http://www.w3.org/2000/01/rdf-schema#")
 
         if obj:
@@ -115,48 +155,79 @@ class KnowledgeGraph(Graph):
             query = f"SELECT DISTINCT ?x WHERE {{ <{entity_uri}> <{relation_uri}> ?x. }}"
 
         self.logger.debug(f"Executing query: {query}")
-        results = self.query(query)
+        results = [row.x for row in self.query(query)]
+
+        crowd_triples = []
+        if self.crowd_overlay is not None:
+            if obj:
+                crowd_triples = [(crowd_triple.subject, crowd_triple.subject_label, crowd_triple)
+                                 for crowd_triple in self.crowd_overlay.get_subjects(relation_uri, entity_uri)]
+            else:
+                crowd_triples = [(crowd_triple.object, crowd_triple.object_label, crowd_triple)
+                                 for crowd_triple in self.crowd_overlay.get_objects(entity_uri, relation_uri)]
+            removed = {answer for answer, _, crowd_triple in crowd_triples if crowd_triple.status == REMOVED}
+            results = [result for result in results if str(result) not in removed]
 
         result_labels = []
-        for row in results:
-            if isinstance(row.x, Literal):
-                result_labels.append(str(row.x))
+        for result in results:
+            if isinstance(result, Literal):
+                result_labels.append(str(result))
             else:
-                label_query = f"SELECT DISTINCT ?label WHERE {{ <{row.x}> <{rdfs.label}> ?label. }}"
+                label_query = f"SELECT DISTINCT ?label WHERE {{ <{result}> <{rdfs.label}> ?label. }}"
                 label_results = self.query(label_query)
                 result_labels.extend([str(label_row.label) for label_row in label_results])
 
-        self.logger.debug(f"Results: {result_labels}")
-        return result_labels
+        crowd_results = []
+        for _, label, crowd_triple in crowd_triples:
+            if crowd_triple.status == REMOVED:
+                continue
+            if label not in result_labels:
+                result_labels.append(label)
+            crowd_results.append((label, crowd_triple.inter_rater, crowd_triple.votes))
+
+        self.logger.debug(f"Results: {result_labels}, crowd results: {crowd_results}")
+        return result_labels, crowd_results
 
-    def get_similar_entities(self, entity_embedding, embeddings, id_to_embedding, top_n=50):
+    def get_similar_entities(self, entity_embedding, embeddings, id_to_embedding, top_n=50, candidate_ids=None):
         """Finds the top_n most similar entities to the given entity embedding using the given embeddings and returns a
-        dataframe with the entity, label, score and rank. A lower score means the entity is more similar to the given entity."""
-        dist = pairwise_distances(entity_embedding.reshape(1, -1), embeddings).reshape(-1)
-        most_likely = dist.argsort()
+        dataframe with the entity, label, score and rank. A lower score means the entity is more similar to the given entity.
+        If candidate_ids are given, only the embeddings with these ids are searched."""
+        if candidate_ids is None:
+            candidate_ids = np.arange(len(embeddings))
+            dist = pairwise_distances(entity_embedding.reshape(1, -1), embeddings).reshape(-1)
+        else:
+            dist = pairwise_distances(entity_embedding.reshape(1, -1), embeddings[candidate_ids]).reshape(-1)
+
+        if top_n < len(dist):
+            most_likely = np.argpartition(dist, top_n)[:top_n]
+            most_likely = most_likely[dist[most_likely].argsort()]
+        else:
+            most_likely = dist.argsort()
 
         similar_entities = pd.DataFrame([
             (
-                id_to_embedding[id][len(rdflib.Namespace("http://www.wikidata.org/entity/")):],
-                self.get_entity_label(str(id_to_embedding[id])),
-                dist[id],
+                id_to_embedding[candidate_ids[index]][len(rdflib.Namespace("http://www.wikidata.org/entity/")):],
+                self.get_entity_label(str(id_to_embedding[candidate_ids[index]])),
+                dist[index],
                 rank + 1
             )
-            for rank, id in enumerate(most_likely[:top_n])],
+            for rank, index in enumerate(most_likely)],
             columns=("Entity", "Label", "Score", "Rank")
         )
         return similar_entities
 
     def find_related_entities(self, entity_uri, relation_uri, top_n=1):
         """Finds the entities that are related to the given entity using the given relation and returns a list of the
-        top n best matches as labels."""
+        top n best matches as labels. Only entities that occur as objects of the relation in the graph are considered.
+        Relations without such entities are searched against all entities."""
         ent_id = self._entity_to_id.get(rdflib.term.URIRef(entity_uri))
         rel_id = self._relation_to_id.get(rdflib.term.URIRef(relation_uri))
         if ent_id is None or rel_id is None:
             return []
 
         result = self.entity_embeddings[ent_id] + self.relation_embeddings[rel_id]
-        related_entities = self.get_similar_entities(result, self.entity_embeddings, self._id_to_entity, top_n)
+        related_entities = self.get_similar_entities(result, self.entity_embeddings, self._id_to_entity, top_n,
+                                                     self._relation_objects.get(rel_id))
 
         return related_entities["Label"].tolist()
 
@@ -187,3 +258,7 @@ class KnowledgeGraph(Graph):
             return self._uri_to_relation[relation_uri]
         except KeyError:
             return ""
+
+    def get_label(self, uri):
+        """Returns the entity or relation label of the URI, or an empty string if it has neither."""
+        return self.get_entity_label(uri) or self.get_relation_label(uri)
@@ -13,6 +13,7 @@ class NamedEntityRecognizer:
         self.model = AutoModelForTokenClassification.from_pretrained(model_name)
         self.pipeline = pipeline("ner", model=self.model, tokenizer=self.tokenizer, aggregation_strategy="average",
                                  device="cpu")
+        self._prefetched = {}
 
     def extract_single_entity(self, question):
         found_entities = self.find_entities(question)
@@ -35,8 +36,15 @@ class NamedEntityRecognizer:
         else:
             return []
 
+    def prefetch(self, questions, batch_size=16):
+        """Runs NER for several questions in one batched pipeline call. find_entities uses the stored results for these
+        questions instead of running the pipeline again. Only the results of the last prefetch are kept."""
+        self._prefetched = dict(zip(questions, self.pipeline(questions, batch_size=batch_size)))
+
     def find_entities(self, question):
-        found_entities = self.pipeline(question)
+        found_entities = self._prefetched.pop(question, None)
+        if found_entities is None:
+            found_entities = self.pipeline(question)
         self.logger.debug(f"Extracted entities: {found_entities}")
         if not found_entities:
             self.logger.debug("No entities found.")
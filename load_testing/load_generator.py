@@ -0,0 +1,148 @@
+import argparse
+import heapq
+import json
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+
+from load_testing.local_speakeasy import LocalSpeakeasy, LocalChatroomManager
+from main import Runner
+
+DEFAULT_QUESTIONS = [
+    "Who is the director of Good Will Hunting?",
+    "Who directed The Bridge on the River Kwai?",
+    "Who is the screenwriter of The Masked Gang: Cyprus?",
+    "When was The Godfather released?",
+    "What is the genre of Good Neighbors?",
+    "Who composed the music for Titanic?",
+    "Recommend movies similar to Hamlet and Othello.",
+    "Given that I like The Lion King, Pocahontas, and The Beauty and the Beast, can you recommend some movies?",
+    "Show me a picture of Halle Berry.",
+    "What does Denzel Washington look like?",
+]
+
+
+class LoadGenerator:
+    """Simulates chat partners in many rooms of a LocalSpeakeasy server. Each room sends questions with exponentially
+    distributed pauses, so that on average every room sends `rate` questions per second."""
+
+    def __init__(self, server, questions, number_of_rooms=100, rate=0.05, seed=None):
+        self.logger = logging.getLogger("load_generator")
+        self.server = server
+        self.questions = questions
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.rooms = [server.create_room() for _ in range(number_of_rooms)]
+        self.sent = 0
+        self.backlog_samples = []
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._send_questions, daemon=True)
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def sample_backlog(self):
+        self.backlog_samples.append((time.monotonic() - self.start_time, self.server.backlog()))
+
+    def _send_questions(self):
+        schedule = [(time.monotonic() + self.random.expovariate(self.rate), index)
+                    for index in range(len(self.rooms))]
+        heapq.heapify(schedule)
+        while not self._stop_event.is_set():
+            send_time, index = heapq.heappop(schedule)
+            if self._stop_event.wait(max(0.0, send_time - time.monotonic())):
+                break
+            self.rooms[index].send_partner_message(self.random.choice(self.questions))
+            self.sent += 1
+            heapq.heappush(schedule, (send_time + self.random.expovariate(self.rate), index))
+
+    def report(self):
+        elapsed = time.monotonic() - self.start_time
+        latencies = np.array(self.server.latencies)
+        backlog = [backlog for _, backlog in self.backlog_samples] or [0]
+        report = {
+            "rooms": len(self.rooms),
+            "rate_per_room": self.rate,
+            "duration": round(elapsed, 2),
+            "sent": self.sent,
+            "answered": len(latencies),
+            "throughput": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+            "latency_p50": round(float(np.percentile(latencies, 50)), 3) if latencies.size else None,
+            "latency_p90": round(float(np.percentile(latencies, 90)), 3) if latencies.size else None,
+            "latency_p99": round(float(np.percentile(latencies, 99)), 3) if latencies.size else None,
+            "latency_max": round(float(latencies.max()), 3) if latencies.size else None,
+            "backlog_final": backlog[-1],
+            "backlog_max": max(backlog),
+            "backlog_growth_per_second": round((backlog[-1] - backlog[0]) / elapsed, 3) if elapsed else 0.0,
+        }
+        return report
+
+
+def load_questions(path):
+    """Reads questions from a text file with one question per line or a JSONL file with a 'question' field."""
+    questions = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line)["question"]
+            questions.append(line)
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the chatbot against a local Speakeasy stand-in and simulates "
+                                                 "chat partners in many rooms. Run it from the repository root with "
+                                                 "'python -m load_testing.load_generator'.")
+    parser.add_argument("--rooms", type=int, default=100, help="number of simulated rooms")
+    parser.add_argument("--rate", type=float, default=0.05, help="questions per second per room")
+    parser.add_argument("--duration", type=float, default=60, help="duration of the load test in seconds")
+    parser.add_argument("--questions", help="text file (one question per line) or JSONL file with questions")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for question selection and timing")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between backlog samples")
+    parser.add_argument("--no-rate-limit", action="store_true",
+                        help="turn off the 1 second request limits of the real Speakeasy chatrooms")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions else DEFAULT_QUESTIONS
+
+    server = LocalSpeakeasy(request_limit=0 if args.no_rate_limit else 1)
+    runner = Runner(chatroom_manager_factory=lambda chatbot: LocalChatroomManager(chatbot, server))
+    generator = LoadGenerator(server, questions, args.rooms, args.rate, args.seed)
+
+    runner.logger.info(f"Starting load test with {args.rooms} rooms at {args.rate} questions per second per room.")
+    generator.start()
+    end_time = time.monotonic() + args.duration
+    next_sample_time = time.monotonic()
+    while time.monotonic() < end_time:
+        answered = len(server.latencies)
+        runner.chatroom_manager.run()
+        if time.monotonic() >= next_sample_time:
+            generator.sample_backlog()
+            next_sample_time = time.monotonic() + args.sample_interval
+        if len(server.latencies) == answered:
+            # Nothing to answer, don't spin and take the GIL away from the generator thread
+            time.sleep(0.01)
+    generator.sample_backlog()
+    generator.stop()
+
+    report = generator.report()
+    runner.logger.info(f"Load test report: {json.dumps(report)}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
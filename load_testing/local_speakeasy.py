@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from chatbot.chatroom_manager import ChatroomManager
+
+
+class LocalMessage:
+    """Stand-in for speakeasypy's RestChatMessage."""
+
+    def __init__(self, ordinal, message, author_alias):
+        self.ordinal = ordinal
+        self.message = message
+        self.author_alias = author_alias
+        self.time_stamp = int(time.time() * 1000)
+        self.sent_at = time.monotonic()
+
+
+class LocalReaction:
+    """Stand-in for speakeasypy's ChatMessageReaction."""
+
+    def __init__(self, message_ordinal, reaction_type):
+        self.message_ordinal = message_ordinal
+        self.type = reaction_type
+
+
+class LocalChatroom:
+    """In-process stand-in for speakeasypy's Chatroom. The bot side uses the same methods as with the real chatroom,
+    the partner side (send_partner_message, send_partner_reaction) is used by the load generator. Every partner message
+    that is marked as processed is reported to the server together with its response latency.
+
+    Like the real chatroom, the room state is cached for request_limit seconds, so new messages only show up after the
+    cache expired, and posting waits until request_limit seconds have passed since the last post. The measured
+    latencies therefore include these delays. With request_limit=0 both limits are off."""
+
+    def __init__(self, server, room_id, my_alias, partner_alias, prompt="", request_limit=1):
+        self.server = server
+        self.room_id = room_id
+        self.my_alias = my_alias
+        self.prompt = prompt
+        self.start_time = int(time.time() * 1000)
+        self.remaining_time = 60 * 60 * 1000
+        self.user_aliases = [my_alias, partner_alias]
+        self.initiated = False
+
+        self.processed_ordinals = {
+            'messages': [],
+            'reactions': [],
+        }
+        self._messages = []
+        self._reactions = []
+        self._unanswered = deque()
+        self._lock = threading.Lock()
+
+        self.request_limit = request_limit
+        self._state_cache = None
+        self._last_state_call = 0
+        self._last_post_call = 0
+
+    def _update_state(self):
+        """Refreshes the cached (messages, reactions) if the cache is older than the request limit."""
+        current_time = time.monotonic()
+        if self._state_cache is not None and current_time - self._last_state_call < self.request_limit:
+            return
+        with self._lock:
+            self._state_cache = (list(self._messages), list(self._reactions))
+        self._last_state_call = current_time
+
+    def get_messages(self, only_partner=True, only_new=True):
+        self._update_state()
+        filtered_messages = self._state_cache[0]
+
+        if only_partner:
+            filtered_messages = [message for message in filtered_messages if message.author_alias != self.my_alias]
+
+        if only_new:
+            processed = set(self.processed_ordinals['messages'])
+            filtered_messages = [message for message in filtered_messages if message.ordinal not in processed]
+
+        return filtered_messages
+
+    def get_reactions(self, only_new=True):
+        self._update_state()
+        filtered_reactions = self._state_cache[1]
+
+        if only_new:
+            processed = set(self.processed_ordinals['reactions'])
+            filtered_reactions = [reaction for reaction in filtered_reactions if
+                                  reaction.message_ordinal not in processed]
+        return filtered_reactions
+
+    def post_messages(self, message):
+        elapsed_time = time.monotonic() - self._last_post_call
+        if elapsed_time < self.request_limit:
+            time.sleep(self.request_limit - elapsed_time)
+        self._add_message(message, self.my_alias)
+        self._last_post_call = time.monotonic()
+
+    def mark_as_processed(self, msg_or_rec):
+        if isinstance(msg_or_rec, LocalMessage):
+            self.processed_ordinals['messages'].append(msg_or_rec.ordinal)
+            with self._lock:
+                if msg_or_rec in self._unanswered:
+                    self._unanswered.remove(msg_or_rec)
+            self.server.record_response(time.monotonic() - msg_or_rec.sent_at)
+        elif isinstance(msg_or_rec, LocalReaction):
+            self.processed_ordinals['reactions'].append(msg_or_rec.message_ordinal)
+        else:
+            logging.error("Please pass a message or reaction object to mark it as processed.")
+
+    def get_chat_partner(self):
+        return next(alias for alias in self.user_aliases if alias != self.my_alias)
+
+    def send_partner_message(self, message):
+        message_object = self._add_message(message, self.get_chat_partner())
+        with self._lock:
+            self._unanswered.append(message_object)
+        return message_object
+
+    def send_partner_reaction(self, message_ordinal, reaction_type="THUMBS_UP"):
+        with self._lock:
+            self._reactions.append(LocalReaction(message_ordinal, reaction_type))
+
+    def backlog(self):
+        """Number of partner messages that have not been answered yet."""
+        with self._lock:
+            return len(self._unanswered)
+
+    def _add_message(self, message, author_alias):
+        with self._lock:
+            message_object = LocalMessage(len(self._messages), message, author_alias)
+            self._messages.append(message_object)
+        return message_object
+
+
+class LocalSpeakeasy:
+    """In-process stand-in for the Speakeasy server. Holds the chatrooms and collects the response latencies of all
+    answered partner messages. request_limit is passed on to the chatrooms, see LocalChatroom. Unlike the real server,
+    the room list itself is not rate limited, rooms are visible as soon as they are created."""
+
+    def __init__(self, username="playful-panther", request_limit=1):
+        self.logger = logging.getLogger("local_speakeasy")
+        self.username = username
+        self.session_token = None
+        self._chatrooms = {}
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.request_limit = request_limit
+
+    def login(self):
+        self.session_token = "local-session"
+        return self.session_token
+
+    def logout(self):
+        self.session_token = None
+
+    def create_room(self, partner_alias=None, prompt=""):
+        with self._lock:
+            room_id = f"room-{len(self._chatrooms)}"
+            room = LocalChatroom(self, room_id, self.username, partner_alias or f"user-{len(self._chatrooms)}", prompt,
+                                 self.request_limit)
+            self._chatrooms[room_id] = room
+        return room
+
+    def get_rooms(self, active=True):
+        with self._lock:
+            rooms = list(self._chatrooms.values())
+        if active:
+            return [room for room in rooms if room.remaining_time > 0]
+        return rooms
+
+    def record_response(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def backlog(self):
+        return sum(room.backlog() for room in self.get_rooms(active=False))
+
+
+class LocalChatroomManager(ChatroomManager):
+    """ChatroomManager that talks to a LocalSpeakeasy server instead of the live Speakeasy host."""
+
+    def __init__(self, chatbot, server):
+        self.logger = logging.getLogger("chatroom_manager")
+        self.server = server
+        self.login()
+        self.clear()
+
+        self.chatbot = chatbot
+
+        self.rooms = []
+
+    def login(self):
+        return self.server.login()
+
+    def logout(self):
+        self.server.logout()
+
+    def get_rooms(self, active=True):
+        return self.server.get_rooms(active)
@@ -1,27 +1,34 @@
+import argparse
+import gc
 import logging
 import os
 
 from chatbot.chatroom_manager import ChatroomManager
 from data.crowd_data import CrowdData
+from data.hot_reload import HotReloader
 
 os.environ['FOR_DISABLE_CONSOLE_CTRL_HANDLER'] = '1'
 from datetime import datetime
 from chatbot.chatbot import ChatBot
-from data.knowledge_graph import KnowledgeGraph
+from data.knowledge_graph import KnowledgeGraph, FULL_GRAPH_PATH
 from language_processing.entity_relation_extraction import NamedEntityRecognizer, RelationExtractor
 
 
 class Runner:
-    def __init__(self):
+    def __init__(self, chatroom_manager_factory=ChatroomManager, graph_path=FULL_GRAPH_PATH):
         self.logger = self.setup_logger()
         self.logger.info("Starting...")
 
-        self.knowledge_graph = KnowledgeGraph()
+        self.knowledge_graph = KnowledgeGraph(graph_path)
         self.named_entity_recognizer = NamedEntityRecognizer()
         self.relation_extractor = RelationExtractor()
         self.crowd_data = CrowdData()
-        self.chatbot = ChatBot(self.knowledge_graph, self.named_entity_recognizer, self.relation_extractor, self.crowd_data)
-        self.chatroom_manager = ChatroomManager(self.chatbot)
+        self.knowledge_graph.apply_crowd_data(self.crowd_data)
+        self.chatbot = ChatBot(self.knowledge_graph, self.named_entity_recognizer, self.relation_extractor)
+        self.chatroom_manager_factory = chatroom_manager_factory
+        self.chatroom_manager = self.chatroom_manager_factory(self.chatbot)
+        self.hot_reloader = HotReloader(self.reload_data, graph_path)
+        self.hot_reloader.start()
 
     def main(self):
         try:
@@ -44,11 +51,21 @@ class Runner:
 
     def restart(self):
         self.logger.info("Restarting...")
-        self.chatroom_manager = ChatroomManager(self.chatbot)
+        self.chatroom_manager = self.chatroom_manager_factory(self.chatbot)
         self.main()
 
+    def reload_data(self, knowledge_graph, crowd_data):
+        """Swaps in a freshly loaded knowledge graph and crowd data without restarting the chatroom manager. The old
+        data is released once the message that currently uses it has been answered."""
+        self.logger.info("Swapping in reloaded data...")
+        self.chatbot.swap_data(knowledge_graph)
+        self.knowledge_graph = knowledge_graph
+        self.crowd_data = crowd_data
+        gc.collect()
+
     def stop(self):
         self.logger.info("Exiting...")
+        self.hot_reloader.stop()
 
     def setup_logger(self):
         """Sets up logging. Each log file is named after the date and time when the chatbot was started. The log files are
@@ -75,5 +92,10 @@ class Runner:
 
 
 if __name__ == "__main__":
-    runner = Runner()
+    parser = argparse.ArgumentParser(description="Runs the chatbot on Speakeasy.")
+    parser.add_argument("--graph", default=FULL_GRAPH_PATH,
+                        help="graph to load, e.g. a serving graph built with "
+                             "'python -m data.build_serving_graph build'")
+    args = parser.parse_args()
+    runner = Runner(graph_path=args.graph)
     runner.main()